@@ -1,71 +1,372 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shelve
+import sys
+import threading
+import time
+import weakref
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from claude_api_key import CLAUDE_API_KEY
 import json
+from dataclasses import dataclass, field
+from functools import lru_cache
 
-def generate_claude_prompt(history):
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
+if orjson is not None:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+    _json_loads = json.loads
+
+log = logging.getLogger(__name__)
+
+CLAUDE_API_URL = "https://api.anthropic.com/v1/messages"
+# A two-way choice on a short prompt doesn't need Opus; Haiku answers in the same format far faster.
+CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "claude-3-haiku-20240307")
+CLAUDE_TEMPERATURE = 0.2
+
+# One keep-alive session for every round, so only the first call pays the TCP + TLS handshake.
+# All calls go to a single host; concurrent callers wait for one of MAX_CONNECTIONS pooled
+# connections (pool_block) instead of opening extra ones that are discarded afterwards.
+# Only connect errors and the listed statuses are retried: a read timeout means the request
+# already reached the server, and resending it could be billed as a second generation.
+MAX_CONNECTIONS = 10
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "x-api-key": CLAUDE_API_KEY,
+    "anthropic-version": "2023-06-01",
+    "content-type": "application/json",
+    "anthropic-beta": "prompt-caching-2024-07-31"
+})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_CONNECTIONS,
+    pool_block=True,
+    max_retries=Retry(
+        total=2,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+        respect_retry_after_header=True
+    )
+))
+
+# Exact-match response cache, persisted across runs. Only used for low-temperature requests,
+# where an identical request body is expected to get the same answer back.
+# Off unless CLAUDE_CACHE=1: replies still vary at this temperature, and replayed ones would be
+# logged like live decisions, turning repeated runs into copies of each other.
+CACHE_ENABLED = os.environ.get("CLAUDE_CACHE") == "1"
+CACHE_PATH = ".claude_cache.db"
+CACHE_MAX_TEMPERATURE = 0.2
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _caching():
+    return CACHE_ENABLED and CLAUDE_TEMPERATURE <= CACHE_MAX_TEMPERATURE
+
+
+def _cache_key(body):
+    """body: the serialized request (see _request_body). Returns None when caching is off."""
+    if not _caching():
+        return None
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _cache_get(key):
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = shelve.open(CACHE_PATH)
+        value = _cache.get(key)
+    if value is None:
+        return None
+    # Unpickling builds new strings; map the move back onto the shared _TRUST/_CHEAT objects
+    move, reasoning = value
+    return sys.intern(move), reasoning
+
+
+def _cache_put(key, value):
+    with _cache_lock:
+        _cache[key] = value
+        _cache.sync()
+
+
+# The rules, history format and task are identical every round; build them once at import.
+_STATIC_PROMPT = (
+    "AI Agent: Game Theory Decision Prompt\nObjective: You are an AI agent participating in a two-player game. Your sole objective is to maximize your own payoff.\n"
+    "Game Rules:\n\nThere are two players: 'AI Agent' (you) and 'Opponent.'\nEach player chooses one of two actions simultaneously: 'Trust' or 'Cheat.'\n"
+    "The payoffs for each combination of actions are as follows (Your Payoff, Opponent's Payoff):\n"
+    "If you choose 'Trust' and Opponent chooses 'Trust': (+2,+2)\nIf you choose 'Trust' and Opponent chooses 'Cheat': (−1,+3)\nIf you choose 'Cheat' and Opponent chooses 'Trust': (+3,−1)\nIf you choose 'Cheat' and Opponent chooses 'Cheat': (0,0)\n"
+    "Multi-Round Game Context:\nThis game will be played over multiple rounds. Before each new round, you will be provided with the outcomes of all previous rounds.\n"
+    "Previous Outcomes (if any):\nA list of past game outcomes will be provided in the format:\n[(Round N Action: Your_Action, Opponent_Action, Your_Payoff, Opponent_Payoff), ...]\n"
+    "\nTask:\nAnalyze the payoff matrix and consider the history of previous outcomes (given at the end) to determine your optimal strategy for the current round. Assuming the opponent is also a rational agent aiming to maximize their own payoff, what action should you choose in this game to maximize your own outcome?\n\nYour Response:\nReply strictly in the following JSON format (do not include any other text):\n{\"action\": \"Trust or Cheat\", \"reason\": \"5-7 word explanation\"}\n"
+)
+_STATIC_BLOCK = {"type": "text", "text": _STATIC_PROMPT, "cache_control": {"type": "ephemeral"}}
+_ROUND_TEMPLATE = "(Round %d: %s, %s, %d, %d)"
+# Every match opens with the same first-round prompt.
+_PROMPT_NO_HISTORY = [_STATIC_BLOCK, {"type": "text", "text": "No previous rounds.\n"}]
+
+
+@dataclass
+class PromptHistory:
     """
-    history: list of dicts with keys: round, agent_move, opponent_move, agent_payoff, opponent_payoff
-    Returns a string prompt for Claude.
-    """
-    prompt = []
-    prompt.append("AI Agent: Game Theory Decision Prompt\nObjective: You are an AI agent participating in a two-player game. Your sole objective is to maximize your own payoff.\n")
-    prompt.append("Game Rules:\n\nThere are two players: 'AI Agent' (you) and 'Opponent.'\nEach player chooses one of two actions simultaneously: 'Trust' or 'Cheat.'\n")
-    prompt.append("The payoffs for each combination of actions are as follows (Your Payoff, Opponent's Payoff):\n")
-    prompt.append("If you choose 'Trust' and Opponent chooses 'Trust': (+2,+2)\nIf you choose 'Trust' and Opponent chooses 'Cheat': (−1,+3)\nIf you choose 'Cheat' and Opponent chooses 'Trust': (+3,−1)\nIf you choose 'Cheat' and Opponent chooses 'Cheat': (0,0)\n")
-    prompt.append("Multi-Round Game Context:\nThis game will be played over multiple rounds. Before each new round, you will be provided with the outcomes of all previous rounds.\n")
-    if history:
-        prompt.append("Previous Outcomes (if any):\nA list of past game outcomes will be provided in the format:\n[(Round N Action: Your_Action, Opponent_Action, Your_Payoff, Opponent_Payoff), ...]\n")
-        history_str = ", ".join([
-            f"(Round {h['round']}: {h['agent_move']}, {h['opponent_move']}, {h['agent_payoff']}, {h['opponent_payoff']})"
-            for h in history
-        ])
-        prompt.append(f"History: [{history_str}]\n")
-    else:
-        prompt.append("No previous rounds.\n")
-    prompt.append("\nTask:\nAnalyze the payoff matrix and consider the history of previous outcomes to determine your optimal strategy for the current round. Assuming the opponent is also a rational agent aiming to maximize their own payoff, what action should you choose in this game to maximize your own outcome?\n\nYour Response:\nReply strictly in the following JSON format (do not include any other text):\n{\"action\": \"Trust or Cheat\", \"reason\": \"5-7 word explanation\"}\n")
-    return "".join(prompt)
+    Column-oriented record of the rounds played so far, one list per field,
+    so the prompt can be built by zipping the columns instead of reading dicts.
+    """
+    rounds: list = field(default_factory=list)
+    agent_moves: list = field(default_factory=list)
+    opp_moves: list = field(default_factory=list)
+    agent_payoffs: list = field(default_factory=list)
+    opp_payoffs: list = field(default_factory=list)
 
+    @classmethod
+    def from_rounds(cls, rounds):
+        """Builds the columns from round dicts (keys as in the simulator's match history)."""
+        history = cls()
+        for r in rounds:
+            history.append(r['round'], r['agent_move'], r['opponent_move'], r['agent_payoff'], r['opponent_payoff'])
+        return history
 
-def call_claude(prompt, max_retries=1):
+    def append(self, round_num, agent_move, opponent_move, agent_payoff, opponent_payoff):
+        self.rounds.append(round_num)
+        self.agent_moves.append(agent_move)
+        self.opp_moves.append(opponent_move)
+        self.agent_payoffs.append(agent_payoff)
+        self.opp_payoffs.append(opponent_payoff)
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def moves_key(self):
+        """The moves played so far as a hashable key; round numbers and payoffs follow from them."""
+        return tuple(zip(self.agent_moves, self.opp_moves))
+
+
+def generate_claude_prompt(history):
     """
-    Calls the Claude 3 Messages API with the given prompt and returns (move, reasoning).
-    Retries once if JSON parsing fails. Logs full response text and status code on error.
+    history: PromptHistory of the rounds played so far (empty for the first round).
+    Returns the prompt as a list of Messages API content blocks. The rules and task never change,
+    so they form a leading block marked for prompt caching; only the history tail varies per round.
+    The returned list may be shared between calls and must not be mutated.
     """
-    url = "https://api.anthropic.com/v1/messages"
-    headers = {
-        "x-api-key": CLAUDE_API_KEY,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
-    data = {
-        "model": "claude-3-opus-20240229",
-        "max_tokens": 100,
-        "temperature": 0.2,
+    if not history:
+        return _PROMPT_NO_HISTORY
+    history_str = ", ".join(_ROUND_TEMPLATE % row for row in zip(
+        history.rounds, history.agent_moves, history.opp_moves, history.agent_payoffs, history.opp_payoffs
+    ))
+    return [_STATIC_BLOCK, {"type": "text", "text": f"History: [{history_str}]\n"}]
+
+
+# Replies map onto these two shared strings, so every returned move is one of two objects.
+_TRUST = sys.intern("TRUST")
+_CHEAT = sys.intern("CHEAT")
+_DEFAULT_REASON = "No reasoning provided."
+# Returned when no valid reply could be had; never cached
+_FALLBACK_REPLY = (_TRUST, "Claude error: see logs")
+
+
+@lru_cache(maxsize=512)
+def _truncate_reason(reason):
+    # Short replies repeat a lot ("Mutual trust maximizes payoff"), so share the truncated copies
+    return reason[:40]
+
+
+def _request_data(prompt):
+    return {
+        "model": CLAUDE_MODEL,
+        # The reply is a ~25-token JSON object; stop decoding as soon as it closes.
+        "max_tokens": 40,
+        "stop_sequences": ["}"],
+        "temperature": CLAUDE_TEMPERATURE,
         "messages": [
             {"role": "user", "content": prompt}
         ]
     }
+
+
+# Everything but the prompt is fixed, so serialize the body once around a placeholder and
+# splice each prompt's JSON in between; per call only the prompt itself is encoded.
+_PROMPT_PLACEHOLDER = "\x00prompt\x00"
+_BODY_PREFIX, _BODY_SUFFIX = _json_dumps(_request_data(_PROMPT_PLACEHOLDER)).split(_json_dumps(_PROMPT_PLACEHOLDER))
+
+
+def _request_body(prompt):
+    return _BODY_PREFIX + _json_dumps(prompt) + _BODY_SUFFIX
+
+
+def _parse_reply(message):
+    """
+    Turns a Messages API response body (already parsed) into (move, reasoning).
+    Raises if the reply text is not the expected JSON object.
+    """
+    # Claude 3 Messages API returns the content as a list of blocks
+    content = message["content"][0]["text"]
+    if message.get("stop_reason") == "stop_sequence":
+        # The matched stop sequence is not included in the returned text
+        content += message["stop_sequence"]
+    content = content.strip()
+    result = _json_loads(content)
+    if not isinstance(result, dict):
+        raise ValueError(f"expected a JSON object, got {type(result).__name__}")
+    # Only an explicit "Cheat" counts as a cheat; anything else ("Cooperate", "Defect", ...) defaults to TRUST
+    action = result.get("action")
+    move = _CHEAT if isinstance(action, str) and action.strip().lower() == "cheat" else _TRUST
+    reasoning = _truncate_reason(str(result.get("reason") or _DEFAULT_REASON))
+    return move, reasoning
+
+
+def call_claude(prompt, max_retries=1):
+    """
+    Calls the Claude 3 Messages API with the given prompt (content blocks from
+    generate_claude_prompt) and returns (move, reasoning).
+    HTTP-level failures (429/5xx) are retried with backoff by the session; max_retries only
+    re-asks when the reply is not valid JSON. Logs status code and full response text at DEBUG level, errors as warnings.
+    With CLAUDE_CACHE=1, successful low-temperature replies are cached on disk and served without an API call.
+    """
+    body = _request_body(prompt)
+    cache_key = _cache_key(body)
+    if cache_key is not None:
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return cached
     for attempt in range(max_retries + 1):
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        print(f"Claude API HTTP status: {response.status_code}")
-        print(f"Claude API raw response: {response.text}")
         try:
+            # 429/5xx responses are retried with backoff by the session's transport adapter.
+            response = _SESSION.post(CLAUDE_API_URL, data=body, timeout=(3.05, 30))
+            log.debug("Claude API HTTP status: %s", response.status_code)
+            if log.isEnabledFor(logging.DEBUG):
+                # .text decodes the whole body again; only pay for it when it will be shown
+                log.debug("Claude API raw response: %s", response.text)
             response.raise_for_status()
-            resp_json = response.json()
-            # Claude 3 Messages API returns the content as a list of blocks
-            content = resp_json["content"][0]["text"].strip()
-            result = json.loads(content)
-            move = result.get("action", "TRUST").upper()
-            if move not in ("TRUST", "CHEAT"):
-                move = "TRUST"
-            reasoning = result.get("reason", "No reasoning provided.")[:40]
-            return move, reasoning
+        except requests.RequestException as e:
+            log.warning("Claude API error: %s", e)
+            break
+        try:
+            move, reasoning = _parse_reply(_json_loads(response.content))
+        except Exception as e:
+            # Malformed reply: the only failure worth re-asking the model about
+            log.warning("Claude API error: %s", e)
+            continue
+        if cache_key is not None:
+            _cache_put(cache_key, (move, reasoning))
+        return move, reasoning
+    # Instead of raising, return a safe fallback
+    return _FALLBACK_REPLY
+
+
+# In-memory replies by move history, in front of the disk cache: a repeated history (every match
+# opens the same way) skips building, serializing and hashing its prompt.
+HISTORY_CACHE_SIZE = 4096
+_history_replies = {}
+
+
+def call_claude_for_history(history, max_retries=1):
+    """
+    Same as call_claude(generate_claude_prompt(history)). With CLAUDE_CACHE=1, replies are also
+    remembered for the rest of the run by history.moves_key(). Failed calls are not remembered.
+    """
+    if not _caching():
+        return call_claude(generate_claude_prompt(history), max_retries)
+    key = history.moves_key()
+    reply = _history_replies.get(key)
+    if reply is None:
+        reply = call_claude(generate_claude_prompt(history), max_retries)
+        if reply is not _FALLBACK_REPLY and len(_history_replies) < HISTORY_CACHE_SIZE:
+            _history_replies[key] = reply
+    return reply
+
+
+def call_claude_batch(prompts, poll_interval=5.0):
+    """
+    Scores many independent prompts through the Message Batches API and returns their
+    (move, reasoning) pairs in order. Use it when all prompts are known up front: one
+    submission replaces len(prompts) requests. Batches complete asynchronously, so this
+    polls every poll_interval seconds until the batch has ended. Cached replies are reused
+    and new ones are cached, as in call_claude; failed requests get the usual fallback.
+    """
+    if len(prompts) == 1:
+        return [call_claude(prompts[0])]
+    results = [None] * len(prompts)
+    pending = {}
+    for i, prompt in enumerate(prompts):
+        data = _request_data(prompt)
+        cache_key = _cache_key(_request_body(prompt))
+        cached = _cache_get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending[f"r{i}"] = (i, data, cache_key)
+    if not pending:
+        return results
+
+    batch_url = f"{CLAUDE_API_URL}/batches"
+    body = {"requests": [{"custom_id": custom_id, "params": data} for custom_id, (_, data, _) in pending.items()]}
+    response = _SESSION.post(batch_url, data=_json_dumps(body), timeout=(3.05, 60))
+    response.raise_for_status()
+    batch = _json_loads(response.content)
+    while batch["processing_status"] != "ended":
+        time.sleep(poll_interval)
+        response = _SESSION.get(f"{batch_url}/{batch['id']}", timeout=(3.05, 30))
+        response.raise_for_status()
+        batch = _json_loads(response.content)
+    response = _SESSION.get(batch["results_url"], timeout=(3.05, 60))
+    response.raise_for_status()
+
+    for line in response.content.splitlines():
+        if not line.strip():
+            continue
+        entry = _json_loads(line)
+        i, _, cache_key = pending[entry["custom_id"]]
+        try:
+            if entry["result"]["type"] != "succeeded":
+                raise ValueError(f"batch request {entry['result']['type']}")
+            results[i] = _parse_reply(entry["result"]["message"])
+            if cache_key is not None:
+                _cache_put(cache_key, results[i])
         except Exception as e:
-            print(f"Claude API error: {e}")
-            if attempt < max_retries:
-                continue
-            else:
-                # Instead of raising, return a safe fallback
-                return "TRUST", f"Claude error: see logs"
-    # Fallback in case all attempts fail
-    return "TRUST", "Claude error: see logs" 
\ No newline at end of file
+            log.warning("Claude API error: %s", e)
+    return [r if r is not None else _FALLBACK_REPLY for r in results]
+
+
+# Upper bound on Claude requests in flight from coroutines, shared by every caller so that
+# gathered sweeps stay under the account's rate limit instead of paying for 429 retries.
+MAX_CONCURRENCY = int(os.environ.get("CLAUDE_MAX_CONCURRENCY", "8"))
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _concurrency_limit():
+    # asyncio primitives belong to one event loop, so keep one semaphore per running loop
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return semaphore
+
+
+async def acall_claude(prompt, max_retries=1):
+    """
+    Async variant of call_claude. Runs the blocking call on a worker thread so several
+    decisions can be awaited together; all of them share the pooled session.
+    At most MAX_CONCURRENCY (env CLAUDE_MAX_CONCURRENCY) calls run at once.
+    """
+    async with _concurrency_limit():
+        return await asyncio.to_thread(call_claude, prompt, max_retries)
+
+
+async def acall_claude_many(prompts):
+    """
+    Runs independent prompts concurrently and returns their (move, reasoning) pairs in order.
+    """
+    return await asyncio.gather(*(acall_claude(p) for p in prompts))
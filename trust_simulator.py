@@ -5,20 +5,22 @@ import os
 os.environ['TK_SILENCE_DEPRECATION'] = '1'  # Suppress deprecation warning
 
 import csv
-import random
 import json
-import string
-from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor
 import tkinter as tk
 from tkinter import ttk
-from threading import Thread
+from threading import Thread, Event, Lock
 import time
+import queue
+import numpy as np
 import matplotlib
 matplotlib.use('TkAgg')
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 from typing import List
-from claude_prompt import generate_claude_prompt, call_claude
+from claude_prompt import PromptHistory, call_claude_for_history
 from datetime import datetime
 
 # --- CONFIGURATION ---
@@ -40,123 +42,64 @@ CONFIG = {
     ],
     'output_csv': 'trust_sim_results.csv',
     'gui_update_delay': 0.2,  # seconds between GUI updates
+    'animation_fps': 30,      # how often the GUI polls for simulation events
+    'workers': 0,             # processes for tournament matches; 0 = play them in this process
 }
 
+# --- MOVES ---
+# Strategies work with move ids; names are only used for the GUI, CSV and Claude boundary.
+TRUST, CHEAT = 0, 1
+MOVE_NAMES = ('TRUST', 'CHEAT')
+MOVE_IDS = {name: i for i, name in enumerate(MOVE_NAMES)}
+
 # --- STRATEGIES ---
-class Strategy:
-    def __init__(self, name):
-        self.name = name
-    def decide(self, history):
-        raise NotImplementedError
-    def __repr__(self):
-        return self.name
-
-class AlwaysTrust(Strategy):
-    def __init__(self):
-        super().__init__('Always Trust')
-    def decide(self, history):
-        return 'TRUST'
-
-class AlwaysCheat(Strategy):
-    def __init__(self):
-        super().__init__('Always Cheat')
-    def decide(self, history):
-        return 'CHEAT'
-
-class TitForTat(Strategy):
-    def __init__(self):
-        super().__init__('Tit-for-Tat')
-    def decide(self, history):
-        if not history:
-            return 'TRUST'
-        return history[-1][0]
-
-class Grudger(Strategy):
-    def __init__(self):
-        super().__init__('Grudger')
-        self.grudge = False
-    def decide(self, history):
-        if not history:
-            self.grudge = False
-            return 'TRUST'
-        if any(opp == 'CHEAT' for opp, _ in history):
-            self.grudge = True
-        return 'CHEAT' if self.grudge else 'TRUST'
-
-class Detective(Strategy):
-    def __init__(self):
-        super().__init__('Detective')
-        self.switched = False
-    def decide(self, history):
-        moves = len(history)
-        if not self.switched:
-            for opp, _ in history:
-                if opp == 'CHEAT':
-                    self.switched = True
-                    break
-        if self.switched:
-            if not history:
-                return 'TRUST'
-            return history[-1][0]
-        else:
-            if moves == 0: return 'TRUST'
-            if moves == 1: return 'CHEAT'
-            if moves == 2: return 'TRUST'
-            if moves == 3: return 'TRUST'
-            self.switched = True
-            return 'CHEAT'
-
-class Simpleton(Strategy):
-    def __init__(self):
-        super().__init__('Simpleton')
-    def decide(self, history):
-        if not history:
-            return 'TRUST'
-        opp, own = history[-1]
-        if own == 'TRUST' and opp == 'CHEAT':
-            return 'CHEAT'
-        else:
-            return own
-
-class RandomStrategy(Strategy):
-    def __init__(self):
-        super().__init__('Random')
-    def decide(self, history):
-        return random.choice(['TRUST', 'CHEAT'])
-
-class Copykitten(Strategy):
-    def __init__(self):
-        super().__init__('Copykitten')
-    def decide(self, history):
-        if len(history) < 2:
-            return 'TRUST'
-        # Only cheats if opponent cheated twice in a row
-        if history[-1][0] == 'CHEAT' and history[-2][0] == 'CHEAT':
-            return 'CHEAT'
-        return 'TRUST'
+# Every strategy is a small state machine over the opponent's last move. These tables are the only
+# definition of the strategies: tournaments run all pairs in lockstep on them, and single matches
+# and the GUI opponent step through one row at a time.
+RANDOM_MOVE = -1
+STRATEGY_NAMES = (
+    'Always Trust', 'Always Cheat', 'Tit-for-Tat', 'Grudger',
+    'Detective', 'Simpleton', 'Random', 'Copykitten',
+)
+STRATEGY_IDS = {name: i for i, name in enumerate(STRATEGY_NAMES)}
+# name -> (move played in each state, next state for each state given opponent's move)
+_STRATEGY_MACHINES = {
+    'Always Trust': ((0,), ((0, 0),)),
+    'Always Cheat': ((1,), ((0, 0),)),
+    # state = opponent's last move
+    'Tit-for-Tat': ((0, 1), ((0, 1), (0, 1))),
+    # state 1 (grudge) is absorbing
+    'Grudger': ((0, 1), ((0, 1), (1, 1))),
+    # states 0-4 play the opening T,C,T,T,C; 5/6 copy the opponent once a cheat is seen or the opening ends
+    'Detective': ((0, 1, 0, 0, 1, 0, 1), ((1, 6), (2, 6), (3, 6), (4, 6), (5, 6), (5, 6), (5, 6))),
+    # keeps its own last move, switching to CHEAT for good after being cheated while trusting
+    'Simpleton': ((0, 1), ((0, 1), (1, 1))),
+    'Random': ((RANDOM_MOVE,), ((0, 0),)),
+    # state = number of consecutive opponent cheats, capped at 2
+    'Copykitten': ((0, 0, 1), ((0, 1), (0, 2), (0, 2))),
+}
+_MAX_STATES = max(len(actions) for actions, _ in _STRATEGY_MACHINES.values())
+ACTION_TABLE = np.zeros((len(STRATEGY_NAMES), _MAX_STATES), dtype=np.int8)
+NEXT_STATE_TABLE = np.zeros((len(STRATEGY_NAMES), _MAX_STATES, 2), dtype=np.int8)
+for _name, (_actions, _next_states) in _STRATEGY_MACHINES.items():
+    ACTION_TABLE[STRATEGY_IDS[_name], :len(_actions)] = _actions
+    NEXT_STATE_TABLE[STRATEGY_IDS[_name], :len(_next_states)] = _next_states
+
+# Strategies that play RANDOM_MOVE in some state, so need random bits drawn for their matches
+HAS_RANDOM = (ACTION_TABLE == RANDOM_MOVE).any(axis=1)
+
+_RNG = np.random.default_rng()
 
 # --- AGENT ---
 class Agent:
+    # Fixed attribute layout: no per-instance __dict__
+    __slots__ = ('strategy_name', 'strategy_id', 'score')
     def __init__(self, strategy_name):
         self.strategy_name = strategy_name
-        self.strategy = self._make_strategy(strategy_name)
+        self.strategy_id = STRATEGY_IDS[strategy_name]
         self.score = 0
-        self.history = []
-    def _make_strategy(self, name):
-        return {
-            'Always Trust': AlwaysTrust(),
-            'Always Cheat': AlwaysCheat(),
-            'Tit-for-Tat': TitForTat(),
-            'Grudger': Grudger(),
-            'Detective': Detective(),
-            'Simpleton': Simpleton(),
-            'Random': RandomStrategy(),
-            'Copykitten': Copykitten(),
-        }[name]
     def reset(self):
-        self.strategy = self._make_strategy(self.strategy_name)
         self.score = 0
-        self.history = []
     def clone(self):
         return Agent(self.strategy_name)
 
@@ -168,19 +111,78 @@ PAYOFF_MATRIX = {
     ('CHEAT', 'TRUST'): (3, -1),   # Agent Cheat, Opponent Trust
     ('CHEAT', 'CHEAT'): (0, 0),    # Both Cheat
 }
+# Same payoffs indexed by move ids: PAYOFF[agent_move][opponent_move] -> (agent, opponent)
+PAYOFF = tuple(tuple(PAYOFF_MATRIX[(a, o)] for o in MOVE_NAMES) for a in MOVE_NAMES)
+# One flat table per side, indexed by the round code (agent_move << 1) | opponent_move
+PAYOFF_A = tuple(payoffs[0] for row in PAYOFF for payoffs in row)
+PAYOFF_O = tuple(payoffs[1] for row in PAYOFF for payoffs in row)
+PAYOFF_ARR = np.array([[PAYOFF_MATRIX[(a, o)] for o in MOVE_NAMES] for a in MOVE_NAMES], dtype=np.int8)
+
+# Plain-tuple copies of the tables: indexing NumPy arrays one scalar at a time is slower than tuples
+_ACTIONS = tuple(map(tuple, ACTION_TABLE.tolist()))
+_NEXT_STATES = tuple(tuple(map(tuple, states)) for states in NEXT_STATE_TABLE.tolist())
+
+def _play_match_kernel(strat_a, strat_b, bits_a, bits_b):
+    """
+    Plays a single match between two strategy ids using only integer state. bits_a/bits_b are
+    each side's random moves, one uint8 per round (see play_match_record).
+    Returns (score_a, score_b, moves_a, moves_b) with moves as bytearrays of move ids, one byte per round.
+    """
+    rounds = len(bits_a)
+    actions_a, actions_b = _ACTIONS[strat_a], _ACTIONS[strat_b]
+    next_a, next_b = _NEXT_STATES[strat_a], _NEXT_STATES[strat_b]
+    state_a = state_b = 0
+    score_a = score_b = 0
+    # Preallocated byte buffers: storing a small int into one allocates nothing, unlike list.append
+    moves_a = bytearray(rounds)
+    moves_b = bytearray(rounds)
+    # Plain bytes: indexing them one round at a time is cheaper than indexing the arrays
+    bits_a = bits_a.tobytes()
+    bits_b = bits_b.tobytes()
+    for r in range(rounds):
+        move_a = actions_a[state_a]
+        if move_a == RANDOM_MOVE:
+            move_a = bits_a[r]
+        move_b = actions_b[state_b]
+        if move_b == RANDOM_MOVE:
+            move_b = bits_b[r]
+        code = move_a << 1 | move_b
+        score_a += PAYOFF_A[code]
+        score_b += PAYOFF_O[code]
+        moves_a[r] = move_a
+        moves_b[r] = move_b
+        state_a = next_a[state_a][move_b]
+        state_b = next_b[state_b][move_a]
+    return score_a, score_b, moves_a, moves_b
 
-def play_match_record(agent, opponent, rounds):
-    agent.history = []
-    opponent.history = []
+def play_match_record(agent, opponent, rounds, rng=None):
+    """
+    Plays one match between two agents, adds the scores to them and returns its per-round dicts.
+    Random moves are drawn from rng (the module generator by default) before the match is played.
+    """
+    rng = _RNG if rng is None else rng
+    strat_a, strat_b = agent.strategy_id, opponent.strategy_id
+    key = (strat_a, strat_b, rounds)
+    cacheable = not (HAS_RANDOM[strat_a] or HAS_RANDOM[strat_b])
+    if cacheable and key in _MATCH_CACHE:
+        score_a, score_b, packed_a, packed_b = _MATCH_CACHE[key]
+        moves_a = np.unpackbits(packed_a, count=rounds).tobytes()
+        moves_b = np.unpackbits(packed_b, count=rounds).tobytes()
+    else:
+        no_bits = np.zeros(rounds, dtype=np.uint8)
+        bits_a = rng.integers(0, 2, rounds, dtype=np.uint8) if HAS_RANDOM[strat_a] else no_bits
+        bits_b = rng.integers(0, 2, rounds, dtype=np.uint8) if HAS_RANDOM[strat_b] else no_bits
+        score_a, score_b, moves_a, moves_b = _play_match_kernel(strat_a, strat_b, bits_a, bits_b)
+        if cacheable:
+            _MATCH_CACHE[key] = (score_a, score_b,
+                                 np.packbits(np.frombuffer(moves_a, dtype=np.uint8)),
+                                 np.packbits(np.frombuffer(moves_b, dtype=np.uint8)))
+    agent.score += score_a
+    opponent.score += score_b
     match_history = []
-    for _ in range(rounds):
-        agent_move = agent.strategy.decide(agent.history)
-        opponent_move = opponent.strategy.decide(opponent.history)
-        payoff_agent, payoff_opp = PAYOFF_MATRIX[(agent_move, opponent_move)]
-        agent.score += payoff_agent
-        opponent.score += payoff_opp
-        agent.history.append((opponent_move, agent_move))
-        opponent.history.append((agent_move, opponent_move))
+    for move_a, move_b in zip(moves_a, moves_b):
+        agent_move, opponent_move = MOVE_NAMES[move_a], MOVE_NAMES[move_b]
+        payoff_agent, payoff_opp = PAYOFF[move_a][move_b]
         match_history.append({
             'agent_move': agent_move,
             'opponent_move': opponent_move,
@@ -191,56 +193,398 @@ def play_match_record(agent, opponent, rounds):
         })
     return match_history
 
-def run_tournament_record(agents, rounds_per_game):
+def _draw_random_moves(rng, strat_a, strat_b, max_rounds):
+    """
+    (bits_a, bits_b): random moves for every round of the pairs whose side a (resp. b) is random,
+    as (max_rounds, n_random_pairs) int8 arrays with one column per such pair, in pair order.
+    """
+    bits_a = rng.integers(0, 2, (max_rounds, int(HAS_RANDOM[strat_a].sum())), dtype=np.int8)
+    bits_b = rng.integers(0, 2, (max_rounds, int(HAS_RANDOM[strat_b].sum())), dtype=np.int8)
+    return bits_a, bits_b
+
+def play_matches(strat_a, strat_b, rounds, rng=None, random_moves=None):
+    """
+    Plays one match per pair, all pairs in lockstep. strat_a/strat_b are strategy ids and
+    rounds the match lengths, one entry per pair. Returns (moves_a, moves_b, score_a, score_b):
+    moves are (pairs, max_rounds) int8 arrays padded with -1 after a match ends.
+    Random moves come from random_moves, laid out as by _draw_random_moves with at least
+    max_rounds rows, or else are drawn from rng, the module generator by default.
+    """
+    rng = _RNG if rng is None else rng
+    n_pairs = len(strat_a)
+    max_rounds = int(rounds.max()) if n_pairs else 0
+    moves_a = np.full((n_pairs, max_rounds), -1, dtype=np.int8)
+    moves_b = np.full((n_pairs, max_rounds), -1, dtype=np.int8)
+    score_a = np.zeros(n_pairs, dtype=np.int32)
+    score_b = np.zeros(n_pairs, dtype=np.int32)
+    state_a = np.zeros(n_pairs, dtype=np.int8)
+    state_b = np.zeros(n_pairs, dtype=np.int8)
+    # Random moves for every round, drawn up front and only for the pairs that have a Random side
+    random_a = HAS_RANDOM[strat_a]
+    random_b = HAS_RANDOM[strat_b]
+    if random_moves is None:
+        random_moves = _draw_random_moves(rng, strat_a, strat_b, max_rounds)
+    bits_a, bits_b = random_moves
+    any_random_a = bits_a.size > 0
+    any_random_b = bits_b.size > 0
+    # With one match length for every pair (a fixed rounds_per_game) no pair ever finishes
+    # early, so the per-round activity mask and masked writes can be skipped
+    uniform = n_pairs > 0 and int(rounds.min()) == max_rounds
+    for r in range(max_rounds):
+        move_a = ACTION_TABLE[strat_a, state_a]
+        move_b = ACTION_TABLE[strat_b, state_b]
+        if any_random_a:
+            move_a[random_a] = bits_a[r]
+        if any_random_b:
+            move_b[random_b] = bits_b[r]
+        if uniform:
+            moves_a[:, r] = move_a
+            moves_b[:, r] = move_b
+        else:
+            active = rounds > r
+            moves_a[active, r] = move_a[active]
+            moves_b[active, r] = move_b[active]
+        state_a = NEXT_STATE_TABLE[strat_a, state_a, move_b]
+        state_b = NEXT_STATE_TABLE[strat_b, state_b, move_a]
+    # Scores in one pass over the finished moves; padding (-1) is masked out for mixed lengths
+    payoff = PAYOFF_ARR[moves_a, moves_b]
+    if uniform:
+        score_a += payoff[:, :, 0].sum(axis=1, dtype=np.int32)
+        score_b += payoff[:, :, 1].sum(axis=1, dtype=np.int32)
+    else:
+        played = moves_a >= 0
+        score_a += np.where(played, payoff[:, :, 0], 0).sum(axis=1, dtype=np.int32)
+        score_b += np.where(played, payoff[:, :, 1], 0).sum(axis=1, dtype=np.int32)
+    return moves_a, moves_b, score_a, score_b
+
+def _play_matches_chunk(args):
+    # Worker entry point; the random moves come from the parent, so forked workers can't repeat them
+    strat_a, strat_b, rounds, bits_a, bits_b = args
+    return play_matches(strat_a, strat_b, rounds, random_moves=(bits_a, bits_b))
+
+_POOL = None
+_POOL_WORKERS = 0
+
+def _worker_pool(workers):
+    """Process pool kept across tournaments; starting worker processes costs more than a generation."""
+    global _POOL, _POOL_WORKERS
+    if _POOL is None or _POOL_WORKERS != workers:
+        if _POOL is not None:
+            _POOL.shutdown()
+        _POOL = ProcessPoolExecutor(max_workers=workers)
+        _POOL_WORKERS = workers
+    return _POOL
+
+def _play_matches_parallel(strat_a, strat_b, rounds, workers, random_moves):
+    """
+    Same result layout as play_matches, with the pairs split into chunks across worker processes.
+    random_moves is laid out as by _draw_random_moves; each chunk gets the columns of its own pairs.
+    """
+    n_pairs = len(strat_a)
+    bounds = np.linspace(0, n_pairs, min(workers * 4, n_pairs) + 1).astype(int)
+    bits_a, bits_b = random_moves
+    # Column of each chunk's first random pair: random pairs before it, counted per side
+    cols_a = np.concatenate(([0], np.cumsum(HAS_RANDOM[strat_a])))[bounds]
+    cols_b = np.concatenate(([0], np.cumsum(HAS_RANDOM[strat_b])))[bounds]
+    chunks = [(strat_a[lo:hi], strat_b[lo:hi], rounds[lo:hi],
+               bits_a[:, cols_a[k]:cols_a[k + 1]], bits_b[:, cols_b[k]:cols_b[k + 1]])
+              for k, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]))]
+    max_rounds = int(rounds.max())
+    moves_a = np.full((n_pairs, max_rounds), -1, dtype=np.int8)
+    moves_b = np.full((n_pairs, max_rounds), -1, dtype=np.int8)
+    score_a = np.zeros(n_pairs, dtype=np.int32)
+    score_b = np.zeros(n_pairs, dtype=np.int32)
+    for lo, hi, result in zip(bounds[:-1], bounds[1:], _worker_pool(workers).map(_play_matches_chunk, chunks)):
+        chunk_moves_a, chunk_moves_b, score_a[lo:hi], score_b[lo:hi] = result
+        width = chunk_moves_a.shape[1]
+        moves_a[lo:hi, :width] = chunk_moves_a
+        moves_b[lo:hi, :width] = chunk_moves_b
+    return moves_a, moves_b, score_a, score_b
+
+@lru_cache(maxsize=8)
+def pair_table(n_agents):
+    """(pair_i, pair_j): every i < j pairing of n_agents, built once per population size. Read-only."""
+    pair_i, pair_j = np.triu_indices(n_agents, 1)
+    pair_i.flags.writeable = False
+    pair_j.flags.writeable = False
+    return pair_i, pair_j
+
+# A match between two deterministic strategies depends only on (strat_a, strat_b, rounds), so its
+# outcome is kept and replayed: (strat_a, strat_b, rounds) -> (score_a, score_b, packed moves_a, packed moves_b).
+# Matches involving Random are never cached. The strategy and payoff tables are constants, so entries never go stale.
+_MATCH_CACHE = {}
+_RANDOM_ID = STRATEGY_IDS['Random']
+
+def run_tournament(strategy_ids, rounds_per_game, seed=None, workers=1):
+    """
+    Round-robin over a population given as an array of strategy ids, with no per-round records.
+    rounds_per_game is a fixed match length or a (low, high) range drawn per pair. Pass seed to
+    make the round counts and Random moves reproducible, whatever the workers count and whichever
+    matches are already cached; workers > 1 plays the pairs in that many processes.
+    Returns (scores, moves): total score per agent, and an int8 buffer of shape (2, pairs, max_rounds)
+    holding both sides' moves for every pair in pair_table order, padded with -1 after each match ends.
+    """
+    rng = _RNG if seed is None else np.random.default_rng(seed)
+    n_agents = len(strategy_ids)
+    pair_i, pair_j = pair_table(n_agents)
+    if isinstance(rounds_per_game, tuple):
+        low, high = rounds_per_game
+        rounds = rng.integers(low, high + 1, size=len(pair_i), dtype=np.int32)
+    else:
+        rounds = np.full(len(pair_i), rounds_per_game, dtype=np.int32)
+    strat_a, strat_b = strategy_ids[pair_i], strategy_ids[pair_j]
+    n_pairs = len(pair_i)
+    # Random moves are drawn for the full pair set before the cache is consulted, so cache hits
+    # can't shift them. Random pairs are never cached, so every column goes to a pair in todo.
+    random_moves = _draw_random_moves(rng, strat_a, strat_b, int(rounds.max()) if n_pairs else 0)
+    keys = list(zip(strat_a.tolist(), strat_b.tolist(), rounds.tolist()))
+    cached = np.array([key in _MATCH_CACHE for key in keys], dtype=bool)
+    # Only matches not seen before are simulated
+    todo = np.flatnonzero(~cached)
+    if workers > 1 and len(todo) > 1:
+        played = _play_matches_parallel(strat_a[todo], strat_b[todo], rounds[todo], workers, random_moves)
+    else:
+        played = play_matches(strat_a[todo], strat_b[todo], rounds[todo], random_moves=random_moves)
+    moves_a = np.full((n_pairs, int(rounds.max()) if n_pairs else 0), -1, dtype=np.int8)
+    moves_b = np.full_like(moves_a, -1)
+    score_a = np.zeros(n_pairs, dtype=np.int32)
+    score_b = np.zeros(n_pairs, dtype=np.int32)
+    width = played[0].shape[1]
+    moves_a[todo, :width], moves_b[todo, :width], score_a[todo], score_b[todo] = played
+    for k in np.flatnonzero(cached).tolist():
+        n_rounds = keys[k][2]
+        score_a[k], score_b[k], packed_a, packed_b = _MATCH_CACHE[keys[k]]
+        moves_a[k, :n_rounds] = np.unpackbits(packed_a, count=n_rounds)
+        moves_b[k, :n_rounds] = np.unpackbits(packed_b, count=n_rounds)
+    for k in todo.tolist():
+        if _RANDOM_ID not in keys[k][:2]:
+            n_rounds = keys[k][2]
+            _MATCH_CACHE[keys[k]] = (
+                int(score_a[k]), int(score_b[k]),
+                np.packbits(moves_a[k, :n_rounds].astype(np.uint8)), np.packbits(moves_b[k, :n_rounds].astype(np.uint8)))
+    scores = np.zeros(n_agents, dtype=np.int32)
+    np.add.at(scores, pair_i, score_a)
+    np.add.at(scores, pair_j, score_b)
+    return scores, np.stack([moves_a, moves_b])
+
+def run_tournament_record(strategy_ids, rounds_per_game, workers=1):
+    """
+    Round-robin over a population given as an array of strategy ids.
+    Returns (scores, matches): total score per agent and one record per match. A record's
+    'moves' holds one byte per round, (agent_move << 1) | opponent_move; read it with
+    round_result or expand_rounds.
+    With workers > 1 the pairs are played in that many processes.
+    """
+    scores, moves = run_tournament(strategy_ids, rounds_per_game, workers=workers)
+    pair_i, pair_j = pair_table(len(strategy_ids))
+    rounds = (moves[0] >= 0).sum(axis=1).tolist()
+    # Both moves of every round in one byte; padding turns into junk bytes past each match's end
+    codes = ((moves[0] << 1) | (moves[1] & 1)).astype(np.uint8)
     matches = []
-    for i, agent in enumerate(agents):
-        for j, opponent in enumerate(agents):
-            if i < j:
-                rounds = random.randint(*rounds_per_game) if isinstance(rounds_per_game, tuple) else rounds_per_game
-                match_history = play_match_record(agent, opponent, rounds)
-                matches.append({
-                    'agent_index': i,
-                    'opponent_index': j,
-                    'agent_strategy': agent.strategy_name,
-                    'opponent_strategy': opponent.strategy_name,
-                    'rounds': match_history
-                })
-    return matches
-
-def evolve_population(agents, eliminate_n, clone_n):
-    agents = sorted(agents, key=lambda a: a.score)
-    survivors = agents[eliminate_n:]
-    best = agents[-clone_n:]
-    clones = [b.clone() for b in best]
-    new_agents = survivors + clones
-    # Reset all for next generation
-    for a in new_agents:
-        a.reset()
-    return new_agents
-
-def strategy_distribution(agents):
-    return dict(Counter(a.strategy_name for a in agents))
+    for k, (i, j) in enumerate(zip(pair_i.tolist(), pair_j.tolist())):
+        matches.append({
+            'agent_index': i,
+            'opponent_index': j,
+            'agent_strategy': STRATEGY_NAMES[strategy_ids[i]],
+            'opponent_strategy': STRATEGY_NAMES[strategy_ids[j]],
+            'moves': codes[k, :rounds[k]].tobytes(),
+        })
+    return scores, matches
 
-def log_round_to_csv(row, csv_file='trust_sim_results.csv'):
-    header = [
-        'match_id', 'round', 'main_agent_strategy', 'opponent_strategy',
-        'main_agent_action', 'opponent_action', 'main_agent_payoff', 'opponent_payoff',
-        'main_agent_total_score', 'opponent_total_score', 'claude_reasoning', 'history_included', 'timestamp',
-        'payoff_matrix'
-    ]
-    file_exists = os.path.isfile(csv_file)
-    write_header = not file_exists or os.path.getsize(csv_file) == 0
-    # Add payoff_matrix to the row with string keys for JSON
-    payoff_matrix_str_keys = {f"{k[0]}-{k[1]}": v for k, v in PAYOFF_MATRIX.items()}
-    row = dict(row)  # Make a copy to avoid mutating input
-    row['payoff_matrix'] = json.dumps(payoff_matrix_str_keys)
-    with open(csv_file, 'a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=header)
+def round_result(moves, idx):
+    """(agent_move, opponent_move, agent_payoff, opponent_payoff) of round idx of a packed match, as move ids."""
+    code = moves[idx]
+    return code >> 1, code & 1, PAYOFF_A[code], PAYOFF_O[code]
+
+def expand_rounds(match):
+    """A tournament match record's rounds as the per-round dicts the GUI displays."""
+    rounds = []
+    for code in match['moves']:
+        rounds.append({
+            'agent_move': MOVE_NAMES[code >> 1],
+            'opponent_move': MOVE_NAMES[code & 1],
+            'agent_payoff': PAYOFF_A[code],
+            'opponent_payoff': PAYOFF_O[code],
+            'agent_strategy': match['agent_strategy'],
+            'opponent_strategy': match['opponent_strategy'],
+        })
+    return rounds
+
+def _select(scores, eliminate_n, clone_n):
+    """(worst, best): indices of the eliminate_n lowest and clone_n highest scores."""
+    n_agents = len(scores)
+    # One partial selection places both cut points: the eliminate_n lowest scores end up first
+    # and the clone_n highest last, without ordering anything else
+    kth = [k for k in (eliminate_n - 1, n_agents - clone_n) if 0 <= k < n_agents]
+    part = np.argpartition(scores, kth) if kth else np.arange(n_agents)
+    return part[:eliminate_n], part[n_agents - clone_n:]
+
+def evolve_population(strategy_ids, scores, eliminate_n, clone_n):
+    """Drops the eliminate_n lowest scorers and clones the clone_n best; returns the new strategy ids."""
+    worst, best = _select(scores, eliminate_n, clone_n)
+    survivors = np.ones(len(scores), dtype=bool)
+    survivors[worst] = False
+    # Scores start from zero again next generation, so only the ids carry over
+    return np.concatenate([strategy_ids[survivors], strategy_ids[best]])
+
+def strategy_distribution(strategy_ids):
+    counts = np.bincount(strategy_ids, minlength=len(STRATEGY_NAMES)).tolist()
+    return {STRATEGY_NAMES[i]: count for i, count in enumerate(counts) if count}
+
+@dataclass
+class Population:
+    """
+    The agent population as parallel arrays, one entry per agent: strategy_ids (int8 ids into
+    STRATEGY_NAMES) and scores (int32, accumulated over the current generation).
+    """
+    strategy_ids: np.ndarray
+    scores: np.ndarray
+
+    @classmethod
+    def from_ids(cls, strategy_ids):
+        strategy_ids = np.asarray(strategy_ids, dtype=np.int8)
+        return cls(strategy_ids, np.zeros(len(strategy_ids), dtype=np.int32))
+
+    @classmethod
+    def random(cls, strategy_names, size):
+        """size agents, each given a strategy drawn uniformly from strategy_names."""
+        pool = np.array([STRATEGY_IDS[name] for name in strategy_names], dtype=np.int8)
+        return cls.from_ids(_RNG.choice(pool, size=size))
+
+    def __len__(self):
+        return len(self.strategy_ids)
+
+    def play(self, rounds_per_game=None, workers=None):
+        """
+        Plays one round-robin, adds the results to scores and returns the match records.
+        rounds_per_game and workers default to CONFIG['rounds_per_game'] and CONFIG['workers'].
+        """
+        if rounds_per_game is None:
+            rounds_per_game = CONFIG['rounds_per_game']
+        if workers is None:
+            workers = CONFIG['workers']
+        scores, matches = run_tournament_record(self.strategy_ids, rounds_per_game, workers)
+        self.scores += scores
+        return matches
+
+    def evolve(self, eliminate_n, clone_n):
+        """Turns this population into the next generation, with scores starting again from zero."""
+        if eliminate_n != clone_n:
+            # The population changes size, so the arrays have to be replaced
+            self.strategy_ids = evolve_population(self.strategy_ids, self.scores, eliminate_n, clone_n)
+            self.scores = np.zeros(len(self.strategy_ids), dtype=np.int32)
+            return self
+        # Same size: the clones simply take over the eliminated agents' slots
+        worst, best = _select(self.scores, eliminate_n, clone_n)
+        self.strategy_ids[worst] = self.strategy_ids[best]
+        self.scores[:] = 0
+        return self
+
+    def distribution(self):
+        return strategy_distribution(self.strategy_ids)
+
+CSV_HEADER = [
+    'match_id', 'round', 'main_agent_strategy', 'opponent_strategy',
+    'main_agent_action', 'opponent_action', 'main_agent_payoff', 'opponent_payoff',
+    'main_agent_total_score', 'opponent_total_score', 'claude_reasoning', 'history_included', 'timestamp',
+]
+# Payoff matrix with string keys for JSON; constant, so it goes in the sidecar file instead of every row
+PAYOFF_MATRIX_STR_KEYS = {f"{k[0]}-{k[1]}": v for k, v in PAYOFF_MATRIX.items()}
+
+def meta_path(csv_file):
+    """Sidecar JSON written next to a results CSV: trust_sim_results.csv -> trust_sim_results_meta.json"""
+    return os.path.splitext(csv_file)[0] + '_meta.json'
+
+def write_csv_meta(csv_file):
+    with open(meta_path(csv_file), 'w') as f:
+        json.dump({'payoff_matrix': PAYOFF_MATRIX_STR_KEYS, 'created': datetime.now().isoformat()}, f)
+
+def _csv_header_matches(csv_file):
+    with open(csv_file, newline='') as f:
+        return next(csv.reader(f), []) == CSV_HEADER
+
+def _move_aside(csv_file):
+    """Renames a results file in another column layout (and its sidecar) so a new one can be started."""
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    stem = os.path.splitext(csv_file)[0]
+    old_file = f"{stem}_old_{stamp}.csv"
+    os.replace(csv_file, old_file)
+    if os.path.isfile(meta_path(csv_file)):
+        os.replace(meta_path(csv_file), meta_path(old_file))
+    print(f"{csv_file} had a different column layout; moved it to {old_file} and started a new file")
+
+# CSV files this process has already checked or written a header for; skips the stat() calls after that
+_HEADER_WRITTEN = set()
+
+class CsvLogger:
+    """
+    Appends round rows to a CSV file kept open for the whole match. Each row is written and
+    flushed as soon as it is logged, so a closed window or killed process loses no played round.
+    May be closed from another thread than the one logging; rows logged after close are dropped.
+    """
+    def __init__(self, csv_file='trust_sim_results.csv'):
+        write_header = False
+        if csv_file not in _HEADER_WRITTEN:
+            write_header = not os.path.isfile(csv_file) or os.path.getsize(csv_file) == 0
+            # Rows appended under another header would be silently misaligned
+            if not write_header and not _csv_header_matches(csv_file):
+                _move_aside(csv_file)
+                write_header = True
+            if not write_header and not os.path.isfile(meta_path(csv_file)):
+                write_csv_meta(csv_file)
+        self.lock = Lock()
+        self.file = open(csv_file, 'a', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=CSV_HEADER)
         if write_header:
-            writer.writeheader()
-        writer.writerow(row)
+            self.writer.writeheader()
+            write_csv_meta(csv_file)
+        _HEADER_WRITTEN.add(csv_file)
+    def log(self, row):
+        with self.lock:
+            if not self.file.closed:
+                self.writer.writerow(row)
+                self.file.flush()
+    def close(self):
+        with self.lock:
+            self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+def log_round_to_csv(row, csv_file='trust_sim_results.csv'):
+    with CsvLogger(csv_file) as logger:
+        logger.log(row)
 
 # --- GUI ---
+def _submit_daemon(fn, *args):
+    """
+    Runs fn(*args) on a daemon thread and returns a Future for its result. Unlike a
+    ThreadPoolExecutor worker, the thread is not joined at exit, so closing the window
+    never waits for an HTTP call still in flight.
+    """
+    future = Future()
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+    Thread(target=run, daemon=True).start()
+    return future
+
+def _signed(val):
+    return f"+{val}" if val > 0 else str(val)
+
+# Payoffs come from a handful of values, so their display text and colour are looked up, not formatted
+_PAYOFF_VALUES = sorted({val for payoffs in PAYOFF_MATRIX.values() for val in payoffs})
+SIGN_STR = {val: _signed(val) for val in _PAYOFF_VALUES}
+SIGN_COLOR = {val: "#43a047" if val > 0 else ("#e53935" if val < 0 else "#888") for val in _PAYOFF_VALUES}
+ROUND_COLOR = {val: 'green' if val > 0 else ('red' if val < 0 else 'gray') for val in _PAYOFF_VALUES}
+
 class TrustSimGUI:
     match_history = []  # Always a list, class attribute fallback
     def __init__(self, root):
@@ -255,6 +599,15 @@ class TrustSimGUI:
         self.running = False
         self.paused = False
         self.sim_thread = None
+        self._stop_event = Event()
+        self._csv_logger = None  # The running match's logger, so closing the window can close it
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        # The simulation thread never touches Tk. It replaces anim_state with the latest round and
+        # queues other events; _drain_queue applies both on the Tk thread.
+        self.anim_state = None
+        self.anim_queue = queue.Queue()
+        self._shown_state = None
+        self._next_round_at = 0.0
         self.generation = 0
         self.max_generations = CONFIG['generations']
         self.status_var = tk.StringVar()
@@ -265,12 +618,20 @@ class TrustSimGUI:
         self.claude_move_var.set("")
         self.match_round_var = tk.StringVar()
         self.match_round_var.set("")
+        # Score labels are bound to these, so a round update only sets values
+        self.agent_total_var = tk.StringVar(value="Total Points: 0")
+        self.opp_total_var = tk.StringVar(value="Total Points: 0")
+        self.agent_round_var = tk.StringVar(value="")
+        self.opp_round_var = tk.StringVar(value="")
+        self._round_label_fg = (None, None)  # Last colours given to the round labels
 
         self.current_match_idx = 0
         self.current_round_idx = 0
+        self._last_highlight = None  # (agent move id, opponent move id) of the highlighted cell
 
         self._build_widgets()
         self.reset_simulation()
+        self.root.after(0, self._drain_queue)
         print("GUI Initialization Complete")
 
     def _build_widgets(self):
@@ -319,9 +680,9 @@ class TrustSimGUI:
         self._draw_stick_figure(self.agent_canvas)
         self.agent_name_label = tk.Label(main_frame, text="AI agent", font=("Arial", 12, "bold"), fg="white", bg=self.bg_color)
         self.agent_name_label.grid(row=1, column=0)
-        self.agent_total_label = tk.Label(main_frame, text="Total Points: 0", font=("Arial", 11, "bold"), fg="white", bg=self.bg_color)
+        self.agent_total_label = tk.Label(main_frame, textvariable=self.agent_total_var, font=("Arial", 11, "bold"), fg="white", bg=self.bg_color)
         self.agent_total_label.grid(row=2, column=0)
-        self.agent_round_label = tk.Label(main_frame, text="", font=("Arial", 14), fg="white", bg=self.bg_color)
+        self.agent_round_label = tk.Label(main_frame, textvariable=self.agent_round_var, font=("Arial", 14), fg="white", bg=self.bg_color)
         self.agent_round_label.grid(row=0, column=0, sticky='s', pady=(170, 0))
 
         # Center matrix with labels
@@ -355,13 +716,12 @@ class TrustSimGUI:
             for j, opponent_move in enumerate(choices):
                 payoff = PAYOFF_MATRIX[(agent_move, opponent_move)]
                 style = matrix_styles[(agent_move, opponent_move)]
-                def sign(val):
-                    return f"+{val}" if val > 0 else (f"{val}" if val < 0 else "0")
                 label = tk.Label(
                     matrix_outer,
-                    text=f"{style['emoji']}  AI: {sign(payoff[0])} | Opp: {sign(payoff[1])}",
+                    text=f"{style['emoji']}  AI: {SIGN_STR[payoff[0]]} | Opp: {SIGN_STR[payoff[1]]}",
                     width=22, height=3, borderwidth=1, relief="ridge",
-                    bg=matrix_bg, fg="black", font=("Arial", 13)
+                    bg=matrix_bg, fg="black", font=("Arial", 13),
+                    highlightbackground='#d3d3d3', highlightthickness=1
                 )
                 label.grid(row=1+i, column=1+j, padx=5, pady=5)
                 self.matrix_labels[i][j] = label  # type: ignore
@@ -372,9 +732,9 @@ class TrustSimGUI:
         self._draw_stick_figure(self.opp_canvas)
         self.opp_name_label = tk.Label(main_frame, text="Opponent", font=("Arial", 12, "bold"), fg="white", bg=self.bg_color)
         self.opp_name_label.grid(row=1, column=2)
-        self.opp_total_label = tk.Label(main_frame, text="Total Points: 0", font=("Arial", 11, "bold"), fg="white", bg=self.bg_color)
+        self.opp_total_label = tk.Label(main_frame, textvariable=self.opp_total_var, font=("Arial", 11, "bold"), fg="white", bg=self.bg_color)
         self.opp_total_label.grid(row=2, column=2)
-        self.opp_round_label = tk.Label(main_frame, text="", font=("Arial", 14), fg="white", bg=self.bg_color)
+        self.opp_round_label = tk.Label(main_frame, textvariable=self.opp_round_var, font=("Arial", 14), fg="white", bg=self.bg_color)
         self.opp_round_label.grid(row=0, column=2, sticky='s', pady=(170, 0))
 
         # Place reasoning row immediately after main_frame (stick figures + matrix)
@@ -408,6 +768,7 @@ class TrustSimGUI:
         self.round_history_frame = tk.Frame(self.round_history_canvas, bg=self.bg_color)
         self.round_history_canvas.create_window((0, 0), window=self.round_history_frame, anchor="nw")
         self.round_history_cells = []  # List of lists: rows, then columns
+        self._scroll_update_pending = False
         self._init_round_history_matrix()
         self.round_history_frame.bind("<Configure>", lambda e: self.round_history_canvas.configure(scrollregion=self.round_history_canvas.bbox("all")))
 
@@ -431,42 +792,70 @@ class TrustSimGUI:
         return move
 
     def highlight_cell(self, move1, move2):
-        # Reset all cells to white matrix background
+        idx1 = MOVE_IDS[move1]
+        idx2 = MOVE_IDS[move2]
+        if (idx1, idx2) == self._last_highlight:
+            return
+        # Only one cell is ever highlighted, so reset just that one to the white matrix background
         matrix_bg = '#ffffff'
-        choices = ['TRUST', 'CHEAT']
-        for i, agent_move in enumerate(choices):
-            for j, opponent_move in enumerate(choices):
-                self.matrix_labels[i][j].config(bg=matrix_bg, fg='black', highlightbackground='#d3d3d3', highlightthickness=1)
+        if self._last_highlight is not None:
+            last1, last2 = self._last_highlight
+            self.matrix_labels[last1][last2].config(bg=matrix_bg, fg='black', highlightbackground='#d3d3d3', highlightthickness=1)
         # Highlight the selected cell with a clear color
-        idx1 = 0 if move1 == 'TRUST' else 1
-        idx2 = 0 if move2 == 'TRUST' else 1
         self.matrix_labels[idx1][idx2].config(bg='#ffe066', fg='black', highlightbackground='#ffd600', highlightthickness=3)
+        self._last_highlight = (idx1, idx2)
 
     def update_agent_labels(self, agent1, agent2):
-        self.agent_name_label.config(text=f"AI agent: {agent1['agent_strategy']}")
-        self.opp_name_label.config(text=f"Opponent: {agent2['opponent_strategy']}")
+        texts = (f"AI agent: {agent1['agent_strategy']}", f"Opponent: {agent2['opponent_strategy']}")
+        if texts != self._name_texts:  # Same match, same names: no Tk call
+            self.agent_name_label.config(text=texts[0])
+            self.opp_name_label.config(text=texts[1])
+            self._name_texts = texts
+
+    def _set_texts(self, updates):
+        """Sets each (StringVar, text) pair, skipping variables already showing that text."""
+        shown = self._shown_texts
+        for var, text in updates:
+            name = str(var)
+            if shown.get(name) != text:
+                var.set(text)
+                shown[name] = text
 
     def reset_simulation(self):
         print("Resetting simulation...")
         self.running = False
+        self._stop_event.set()  # Tells a running worker not to queue any more rounds
+        # Drop what an earlier run left queued so it can't repaint the cleared display
+        self.anim_state = self._shown_state = None
+        while True:
+            try:
+                self.anim_queue.get_nowait()
+            except queue.Empty:
+                break
         self.paused = False
         self.generation = 0
         self.status_var.set("Ready.")
         self.start_btn.config(state=tk.NORMAL)
         self.reset_btn.config(state=tk.NORMAL)
-        self.agents = [Agent(random.choice(CONFIG['strategies'])) for _ in range(CONFIG['num_agents'])]
+        self.population = Population.random(CONFIG['strategies'], CONFIG['num_agents'])
         self.match_history = []  # Always a list
         self.current_match_idx = 0
         self.current_round_idx = 0
         self.agent_name_label.config(text="AI agent: ")
         self.opp_name_label.config(text="Opponent: ")
-        self.agent_total_label.config(text="Total Points: 0")
-        self.opp_total_label.config(text="Total Points: 0")
-        self.agent_round_label.config(text="")
-        self.opp_round_label.config(text="")
+        self._name_texts = ("AI agent: ", "Opponent: ")
+        self.agent_total_var.set("Total Points: 0")
+        self.opp_total_var.set("Total Points: 0")
+        # Running totals and how far into which match they have been summed
+        self._cum_agent = [0]
+        self._cum_opp = [0]
+        self._totals_first_round = None
+        self.agent_round_var.set("")
+        self.opp_round_var.set("")
         self.claude_move_var.set("")
         self.claude_reason_var.set("")
         self.match_round_var.set("")
+        self._shown_texts = {}  # StringVar name -> text last set through _set_texts
         self.highlight_cell('TRUST', 'TRUST')
         self.rounds_entry.state(["!disabled"])
         self.opp_strategy_combo.state(["!disabled"])
@@ -479,100 +868,180 @@ class TrustSimGUI:
             return
         self.running = True
         self.paused = False
-        self.start_btn.config(state=tk.DISABLED)
-        self.reset_btn.config(state=tk.DISABLED)
-        self.rounds_entry.state(["disabled"])
-        self.opp_strategy_combo.state(["disabled"])
-        self.sim_thread = Thread(target=self._run_simulation)
-        self.sim_thread.daemon = True
-        self.sim_thread.start()
-
-    def _run_simulation(self):
-        print("Simulation thread started (single match mode)")
+        self._stop_event.clear()
+        self._set_controls(False)
+        # Tk variables are read here, on the Tk thread, and handed to the worker
         try:
             rounds = int(self.rounds_var.get())
         except Exception:
             rounds = 5
         opp_strategy = self.opp_strategy_var.get() or CONFIG['strategies'][0]
+        self.sim_thread = Thread(target=self._run_simulation, args=(rounds, opp_strategy))
+        self.sim_thread.daemon = True
+        self.sim_thread.start()
+
+    def _run_simulation(self, rounds, opp_strategy):
+        print("Simulation thread started (single match mode)")
         opponent = Agent(opp_strategy)
         match_history = []
+        # The opponent plays from its strategy table: one lookup per round for its move and next state
+        opp_actions = _ACTIONS[opponent.strategy_id]
+        opp_next_states = _NEXT_STATES[opponent.strategy_id]
+        opp_state = 0
+        # A Random opponent's moves for the whole match, drawn from the same generator as the match id
+        opp_bits = _RNG.integers(0, 2, rounds, dtype=np.uint8).tolist() if HAS_RANDOM[opponent.strategy_id] else None
+        prompt_history = PromptHistory()  # Grows by one round per round; never rebuilt
         agent_score = 0
         opponent_score = 0
-        match_id = ''.join(random.choices(string.digits, k=8))
-        for round_num in range(1, rounds+1):
-            if not self.running:
-                break
-            prompt_history = [
-                {
-                    'round': idx+1,
-                    'agent_move': h['agent_move'],
-                    'opponent_move': h['opponent_move'],
-                    'agent_payoff': h['agent_payoff'],
-                    'opponent_payoff': h['opponent_payoff']
-                } for idx, h in enumerate(match_history)
-            ]
-            prompt = generate_claude_prompt(prompt_history)
-            try:
-                agent_move, reasoning = call_claude(prompt)
-            except Exception as e:
-                self.root.after(0, lambda: self.claude_reason_var.set(f"Claude error: {e}"))
-                self.running = False
-                return
-            opponent_move = opponent.strategy.decide([
-                (h['agent_move'], h['opponent_move']) for h in match_history
-            ])
-            payoff_agent, payoff_opp = PAYOFF_MATRIX[(agent_move, opponent_move)]
-            agent_score += payoff_agent
-            opponent_score += payoff_opp
-            match_history.append({
-                'round': round_num,
-                'agent_move': agent_move,
-                'opponent_move': opponent_move,
-                'agent_payoff': payoff_agent,
-                'opponent_payoff': payoff_opp,
-                'agent_strategy': 'Claude',
-                'opponent_strategy': opponent.strategy_name,
-                'reasoning': reasoning
-            })
-            # Log to CSV
-            log_row = {
-                'match_id': match_id,
-                'round': round_num,
-                'main_agent_strategy': 'Claude',
-                'opponent_strategy': opponent.strategy_name,
-                'main_agent_action': agent_move,
-                'opponent_action': opponent_move,
-                'main_agent_payoff': payoff_agent,
-                'opponent_payoff': payoff_opp,
-                'main_agent_total_score': agent_score,
-                'opponent_total_score': opponent_score,
-                'claude_reasoning': reasoning,
-                'history_included': round_num > 1,
-                'timestamp': datetime.now().isoformat()
-            }
-            log_round_to_csv(log_row)
-            self.match_history = [
-                {
-                    'agent_index': 0,
-                    'opponent_index': 0,
+        match_id = '%08d' % _RNG.integers(10**8)
+        # One open file for the whole match. Each row is written as soon as its round is played: every
+        # round cost a Claude call, and the daemon worker dies without cleanup if the window is closed.
+        csv_logger = self._csv_logger = CsvLogger(CONFIG['output_csv'])
+        pending = None  # GUI update of the last round, published while the next Claude call runs
+
+        def publish(update):
+            if not self._stop_event.is_set():
+                self.anim_state = update
+
+        # Names used every round, bound once as locals
+        submit = _submit_daemon  # Claude calls stay sequential, but this thread keeps working while one is in flight
+        now = datetime.now
+        move_ids, move_names, payoff = MOVE_IDS, MOVE_NAMES, PAYOFF
+        append_prompt = prompt_history.append
+        append_round = match_history.append
+        opp_name = opponent.strategy_name
+        try:
+            for round_num in range(1, rounds+1):
+                if not self.running:
+                    break
+                # prompt_history is only appended to after the call returns
+                future = submit(call_claude_for_history, prompt_history)
+                # The opponent only sees earlier rounds, so its move can be decided during the call
+                opponent_move_id = opp_actions[opp_state]
+                if opponent_move_id == RANDOM_MOVE:
+                    opponent_move_id = opp_bits[round_num - 1]
+                if pending is not None:
+                    publish(pending)
+                    pending = None
+                try:
+                    agent_move, reasoning = future.result()
+                except Exception as e:
+                    self.anim_queue.put(('reason', f"Claude error: {e}"))
+                    self.running = False
+                    return
+                agent_move_id = move_ids[agent_move]
+                opp_state = opp_next_states[opp_state][agent_move_id]
+                opponent_move = move_names[opponent_move_id]
+                payoff_agent, payoff_opp = payoff[agent_move_id][opponent_move_id]
+                agent_score += payoff_agent
+                opponent_score += payoff_opp
+                append_prompt(round_num, agent_move, opponent_move, payoff_agent, payoff_opp)
+                append_round({
+                    'round': round_num,
+                    'agent_move': agent_move,
+                    'opponent_move': opponent_move,
+                    'agent_payoff': payoff_agent,
+                    'opponent_payoff': payoff_opp,
                     'agent_strategy': 'Claude',
-                    'opponent_strategy': opponent.strategy_name,
-                    'rounds': match_history
+                    'opponent_strategy': opp_name,
+                    'reasoning': reasoning
+                })
+                # Log to CSV
+                log_row = {
+                    'match_id': match_id,
+                    'round': round_num,
+                    'main_agent_strategy': 'Claude',
+                    'opponent_strategy': opp_name,
+                    'main_agent_action': agent_move,
+                    'opponent_action': opponent_move,
+                    'main_agent_payoff': payoff_agent,
+                    'opponent_payoff': payoff_opp,
+                    'main_agent_total_score': agent_score,
+                    'opponent_total_score': opponent_score,
+                    'claude_reasoning': reasoning,
+                    'history_included': round_num > 1,
+                    'timestamp': now().isoformat()
+                }
+                csv_logger.log(log_row)
+                update = {
+                    'match_history': [
+                        {
+                            'agent_index': 0,
+                            'opponent_index': 0,
+                            'agent_strategy': 'Claude',
+                            'opponent_strategy': opp_name,
+                            'rounds': match_history[:]  # Snapshot; the worker keeps appending
+                        }
+                    ],
+                    'step': (0, len(match_history)-1),
+                    'reasoning': reasoning,
                 }
-            ]
-            self.current_match_idx = 0
-            self.current_round_idx = len(match_history)-1
-            self.root.after(0, self._show_current_step)
-            self.root.after(0, lambda r=reasoning: self.claude_reason_var.set(r))
-            time.sleep(CONFIG['gui_update_delay'])
+                pending = update
+        finally:
+            # The last round has no next call to hide behind; publish skips it if the match was reset
+            if pending is not None:
+                publish(pending)
+            csv_logger.close()
+            if self._csv_logger is csv_logger:
+                self._csv_logger = None
         self.running = False
-        self.start_btn.config(state=tk.NORMAL)
-        self.reset_btn.config(state=tk.NORMAL)
-        self.rounds_entry.state(["!disabled"])
-        self.opp_strategy_combo.state(["!disabled"])
-        self.status_var.set("Simulation complete.")
+        if not self._stop_event.is_set():  # After a reset the controls are already restored
+            self.anim_queue.put(('controls', True))
+            self.anim_queue.put(('status', "Simulation complete."))
         print("Simulation thread ended (single match mode)")
 
+    def _on_close(self):
+        # The worker is a daemon thread and won't get to its cleanup once the main loop ends
+        self.running = False
+        self._stop_event.set()
+        if self._csv_logger is not None:
+            self._csv_logger.close()
+        self.root.destroy()
+
+    def _drain_queue(self):
+        # Polled at animation_fps on the Tk thread. The latest round is drawn at most once per
+        # gui_update_delay, so rounds finishing faster than that are collapsed into one redraw.
+        now = time.monotonic()
+        if self.anim_state is not self._shown_state and now >= self._next_round_at:
+            self._show_latest_state()
+            self._next_round_at = now + CONFIG['gui_update_delay']
+        status = None
+        while True:
+            try:
+                kind, payload = self.anim_queue.get_nowait()
+            except queue.Empty:
+                break
+            # Events follow the rounds published before them, so draw those first
+            if self.anim_state is not self._shown_state:
+                self._show_latest_state()
+            if kind == 'status':
+                status = payload  # Only the last status of a batch is ever visible
+            elif kind == 'reason':
+                self.claude_reason_var.set(payload)
+            elif kind == 'controls':
+                self._set_controls(payload)
+        if status is not None:
+            self.status_var.set(status)
+        self.root.after(max(1, int(1000 / CONFIG['animation_fps'])), self._drain_queue)
+
+    def _show_latest_state(self):
+        state = self.anim_state
+        self._shown_state = state
+        self._apply_update(state)
+
+    def _set_controls(self, enabled):
+        self.start_btn.config(state=tk.NORMAL if enabled else tk.DISABLED)
+        self.reset_btn.config(state=tk.NORMAL if enabled else tk.DISABLED)
+        self.rounds_entry.state(["!disabled" if enabled else "disabled"])
+        self.opp_strategy_combo.state(["!disabled" if enabled else "disabled"])
+
+    def _apply_update(self, update):
+        # Runs on the Tk thread: one published state carries everything needed to redraw
+        self.match_history = update['match_history']
+        self.current_match_idx, self.current_round_idx = update['step']
+        self.claude_reason_var.set(update['reasoning'])
+        self._show_current_step()
+
     def _show_current_step(self):
         if not self.match_history or not isinstance(self.match_history, list):
             return
@@ -588,39 +1057,47 @@ class TrustSimGUI:
         round_data = match['rounds'][self.current_round_idx]
         self.update_agent_labels(match, match)
         self.highlight_cell(round_data['agent_move'], round_data['opponent_move'])
-        # Calculate running totals
-        agent_total = 0
-        opp_total = 0
-        for m in self.match_history[:self.current_match_idx]:
-            for r in m['rounds']:
-                agent_total += r['agent_payoff']
-                opp_total += r['opponent_payoff']
-        for r in match['rounds'][:self.current_round_idx+1]:
-            agent_total += r['agent_payoff']
-            opp_total += r['opponent_payoff']
-        self.agent_total_label.config(text=f"Total Points: {agent_total}")
-        self.opp_total_label.config(text=f"Total Points: {opp_total}")
+        # Running totals from prefix sums over the match's rounds: _cum_agent[k] is the agent's total
+        # after k rounds of it. Stepping back is a lookup; stepping forward appends only the new rounds.
+        rounds = match['rounds']
+        upto = self.current_round_idx + 1
+        if rounds[0] is not self._totals_first_round:
+            # Another match: the sums start from the totals of the matches before it
+            agent_base = opp_base = 0
+            for m in self.match_history[:self.current_match_idx]:
+                for r in m['rounds']:
+                    agent_base += r['agent_payoff']
+                    opp_base += r['opponent_payoff']
+            self._cum_agent = [agent_base]
+            self._cum_opp = [opp_base]
+            self._totals_first_round = rounds[0]
+        cum_agent, cum_opp = self._cum_agent, self._cum_opp
+        for r in rounds[len(cum_agent) - 1:upto]:
+            cum_agent.append(cum_agent[-1] + r['agent_payoff'])
+            cum_opp.append(cum_opp[-1] + r['opponent_payoff'])
         # Show round result labels
         payoff_agent = round_data['agent_payoff']
         payoff_opp = round_data['opponent_payoff']
-        def payoff_color(val):
-            if val > 0:
-                return 'green'
-            elif val < 0:
-                return 'red'
-            else:
-                return 'gray'
-        self.agent_round_label.config(text=f"{('+' if payoff_agent >= 0 else '')}{payoff_agent}", fg=payoff_color(payoff_agent))
-        self.opp_round_label.config(text=f"{('+' if payoff_opp >= 0 else '')}{payoff_opp}", fg=payoff_color(payoff_opp))
+        # Colours only change when the sign of a payoff does
+        round_fg = (ROUND_COLOR[payoff_agent], ROUND_COLOR[payoff_opp])
+        if round_fg != self._round_label_fg:
+            self.agent_round_label.config(fg=round_fg[0])
+            self.opp_round_label.config(fg=round_fg[1])
+            self._round_label_fg = round_fg
         # Show Claude's move and reasoning together in the reasoning row
         move = round_data['agent_move']
         reasoning = round_data.get('reasoning', '')
-        if reasoning:
-            self.claude_combined_var.set(f"Claude: {move} — {reasoning}")
-        else:
-            self.claude_combined_var.set(f"Claude: {move}")
-        # Show match/round info at top center
-        self.match_round_var.set(f"Match {match.get('opponent_index', 0)+1} | Round {round_data['round']}")
+        combined = f"Claude: {move} — {reasoning}" if reasoning else f"Claude: {move}"
+        # Only labels whose text differs from the last frame are touched
+        self._set_texts((
+            (self.agent_total_var, f"Total Points: {cum_agent[upto]}"),
+            (self.opp_total_var, f"Total Points: {cum_opp[upto]}"),
+            (self.agent_round_var, SIGN_STR[payoff_agent]),
+            (self.opp_round_var, SIGN_STR[payoff_opp]),
+            (self.claude_combined_var, combined),
+            # Match/round info at top center
+            (self.match_round_var, f"Match {match.get('opponent_index', 0)+1} | Round {round_data['round']}"),
+        ))
         self.status_var.set(f"Gen {self.generation} | Match {self.current_match_idx+1}/{len(self.match_history)} | Round {self.current_round_idx+1}/{len(match['rounds'])}")
         # Update round history matrix
         self._update_round_history_matrix(match['rounds'])
@@ -629,48 +1106,71 @@ class TrustSimGUI:
         # Clear previous
         for widget in self.round_history_frame.winfo_children():
             widget.destroy()
-        self.round_history_cells = []
         # 5 rows: Header, AI move, Opp move, AI pts, Opp pts
         row_labels = ["Round", "AI Move", "Opp Move", "AI Pts", "Opp Pts"]
         for r, label in enumerate(row_labels):
             l = tk.Label(self.round_history_frame, text=label, font=("Arial", 10, "bold"), fg="white", bg=self.bg_color, padx=6, pady=2)
             l.grid(row=r, column=0, sticky="nsew")
         self.round_history_cells = [[] for _ in range(5)]
+        self._round_history_first = None  # First round dict of the match the columns belong to
+        # Shared Label options per row kind, built once instead of spelled out per cell
+        self._round_cell_style = {'font': ("Arial", 10), 'fg': "#ffe066", 'bg': self.bg_color, 'padx': 6, 'pady': 2, 'borderwidth': 1, 'relief': "ridge"}
+        self._move_cell_style = {'font': ("Arial", 13), 'bg': self.bg_color, 'padx': 6, 'pady': 2}
+        self._pts_cell_style = {'font': ("Arial", 10, "bold"), 'bg': self.bg_color, 'padx': 6, 'pady': 2}
 
     def _update_round_history_matrix(self, match_history):
-        # Remove old round columns
-        for r in range(5):
-            for cell in self.round_history_cells[r]:
-                cell.destroy()
-            self.round_history_cells[r] = []
-        # Add new columns for each round
+        cells = self.round_history_cells
+        shown = len(cells[0])
+        first = match_history[0] if match_history else None
+        if first is not self._round_history_first:
+            # A different match: none of the existing columns apply
+            keep = 0
+            self._round_history_first = first
+        else:
+            # Same match: rounds already shown never change, so keep them as they are
+            keep = min(shown, len(match_history))
+        if keep < shown:
+            for row in cells:
+                for cell in row[keep:]:
+                    cell.destroy()
+                del row[keep:]
+        # Add columns only for rounds not shown yet
         emoji = {"TRUST": "🤝", "CHEAT": "💔"}
-        for c, round_data in enumerate(match_history):
+        frame = self.round_history_frame
+        round_style, move_style, pts_style = self._round_cell_style, self._move_cell_style, self._pts_cell_style
+        for c in range(keep, len(match_history)):
+            round_data = match_history[c]
             # Round number
-            l0 = tk.Label(self.round_history_frame, text=str(round_data['round']), font=("Arial", 10), fg="#ffe066", bg=self.bg_color, padx=6, pady=2, borderwidth=1, relief="ridge")
+            l0 = tk.Label(frame, text=str(round_data['round']), **round_style)
             l0.grid(row=0, column=c+1, sticky="nsew")
             # AI move
             agent_move = round_data.get('agent_move')
-            l1 = tk.Label(self.round_history_frame, text=emoji.get(agent_move, str(agent_move) if agent_move is not None else ''), font=("Arial", 13), fg="#4dd0e1" if agent_move=="TRUST" else "#e57373", bg=self.bg_color, padx=6, pady=2)
+            l1 = tk.Label(frame, text=emoji.get(agent_move, str(agent_move) if agent_move is not None else ''), fg="#4dd0e1" if agent_move=="TRUST" else "#e57373", **move_style)
             l1.grid(row=1, column=c+1, sticky="nsew")
             # Opp move
             opp_move = round_data.get('opponent_move')
-            l2 = tk.Label(self.round_history_frame, text=emoji.get(opp_move, str(opp_move) if opp_move is not None else ''), font=("Arial", 13), fg="#64b5f6" if opp_move=="TRUST" else "#ffb74d", bg=self.bg_color, padx=6, pady=2)
+            l2 = tk.Label(frame, text=emoji.get(opp_move, str(opp_move) if opp_move is not None else ''), fg="#64b5f6" if opp_move=="TRUST" else "#ffb74d", **move_style)
             l2.grid(row=2, column=c+1, sticky="nsew")
             # AI pts
             pts = round_data['agent_payoff']
-            l3 = tk.Label(self.round_history_frame, text=f"{('+' if pts>=0 else '')}{pts}", font=("Arial", 10, "bold"), fg=("#43a047" if pts>0 else ("#e53935" if pts<0 else "#888")), bg=self.bg_color, padx=6, pady=2)
+            l3 = tk.Label(frame, text=SIGN_STR[pts], fg=SIGN_COLOR[pts], **pts_style)
             l3.grid(row=3, column=c+1, sticky="nsew")
             # Opp pts
             pts2 = round_data['opponent_payoff']
-            l4 = tk.Label(self.round_history_frame, text=f"{('+' if pts2>=0 else '')}{pts2}", font=("Arial", 10, "bold"), fg=("#43a047" if pts2>0 else ("#e53935" if pts2<0 else "#888")), bg=self.bg_color, padx=6, pady=2)
+            l4 = tk.Label(frame, text=SIGN_STR[pts2], fg=SIGN_COLOR[pts2], **pts_style)
             l4.grid(row=4, column=c+1, sticky="nsew")
-            self.round_history_cells[0].append(l0)
-            self.round_history_cells[1].append(l1)
-            self.round_history_cells[2].append(l2)
-            self.round_history_cells[3].append(l3)
-            self.round_history_cells[4].append(l4)
-        self.round_history_frame.update_idletasks()
+            cells[0].append(l0)
+            cells[1].append(l1)
+            cells[2].append(l2)
+            cells[3].append(l3)
+            cells[4].append(l4)
+        # Columns changed: refit the scroll region once Tk has laid them out, rather than forcing a layout now
+        if len(cells[0]) != shown and not self._scroll_update_pending:
+            self._scroll_update_pending = True
+            self.root.after_idle(self._apply_scroll)
+
+    def _apply_scroll(self):
+        self._scroll_update_pending = False
         self.round_history_canvas.configure(scrollregion=self.round_history_canvas.bbox("all"))
 
 def main():